@@ -22,6 +22,7 @@ except (FileNotFoundError, json.JSONDecodeError) as e:
 POSTER_FOLDER = os.path.join(CURRENT_DIR, "poster")  # 海报图片文件夹
 TEMPLATE_FOLDER = os.path.join(CURRENT_DIR, "template")  # 模板图片
 OUTPUT_FOLDER = os.path.join(CURRENT_DIR, "output")  # 输出文件夹
+COLOR_CACHE_PATH = os.path.join(OUTPUT_FOLDER, ".color_cache.json")  # 海报主色调缓存
 if isinstance(JSON_CONFIG["jellyfin"], list):
     JELLYFIN_CONFIGS = []  # 如果有多个配置，初始化为空列表
     for json_config in JSON_CONFIG["jellyfin"]:
@@ -106,6 +107,7 @@ POSTER_GEN_CONFIG = {
     "SAVE_COLUMNS": True,  # 是否保存每列图片
     "CELL_WIDTH": 410,  # 海报宽度
     "CELL_HEIGHT": 610,  # 海报高度
+    "PNG_COMPRESS_LEVEL": 1,  # PNG压缩级别（0-9），越低保存越快，文件越大
 }
 
 # 海报下载配置
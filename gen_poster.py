@@ -1,58 +1,210 @@
 from PIL import Image, ImageFilter, ImageDraw, ImageFont
+import numpy as np
 import os
 import math
+import logging
 import config
 import random  # 添加随机模块
 from logger import get_module_logger
 import colorsys
+import hashlib
+import json
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 # 获取模块日志记录器
 logger = get_module_logger("gen_poster")
 
+# 主色调缓存的版本号，提取算法变化时需要同步修改，使旧缓存失效
+COLOR_CACHE_VERSION = 3
+# 主色调缓存最多保留的条目数
+COLOR_CACHE_MAX_ENTRIES = 500
+# 主色调缓存（运行期间保存在内存中，首次使用时从磁盘加载）
+color_cache = None
+# 解码海报的线程数，在生成海报的子进程中会按该进程分到的CPU数重新设置
+poster_decode_workers = os.cpu_count() or 1
+
+# 渐变背景左侧颜色由主题色加深得到（降低35%）
+BACKGROUND_DARKEN_FACTOR = 0.65
+# 右侧颜色由左侧颜色按比例提亮
+BACKGROUND_LIGHTEN_FACTOR = 1.9
+# 右侧颜色相对左侧颜色至少提亮的数值
+BACKGROUND_MIN_LIGHTEN = 80
+# 右侧颜色各通道的最大值，确保不会太亮
+BACKGROUND_MAX_LIGHTNESS = 230
+
+# 渐变颜色查找表的插值系数，共256级
+GRADIENT_STEPS = np.linspace(0, 1, 256, dtype=np.float32)[:, None]
+
+# 文字中换行的额外行间距，与 ImageDraw.multiline_text 的默认值一致
+TEXT_NEWLINE_SPACING = 4
+
+# 英文名字体大小查找表，按 max(最长单词长度, 单词数量*3) 索引
+# 超过10时字体大小与文本长度成反比，最小为30，更长的文本都使用最小字体
+ENG_FONT_SIZE_BASE = 50
+ENG_FONT_SIZE_LUT = [
+    ENG_FONT_SIZE_BASE if n <= 10 else int(max(ENG_FONT_SIZE_BASE * (10 / n) ** 0.8, 30))
+    for n in range(256)
+]
+
+# 阴影透明度查找表，把模糊后的透明度 a 映射为 a^4/255^3
+# 阴影浓度与以自身透明度为遮罩连续粘贴两次相同，浅色边缘衰减得更快
+SHADOW_ALPHA_LUT = [round(a**4 / 255**3) for a in range(256)]
+
+
+def prepare_poster(poster_path, cell_width, cell_height):
+    """
+    打开海报并调整为固定尺寸，在线程池中并发执行
+
+    参数:
+        poster_path: 海报文件路径
+        cell_width: 海报宽度
+        cell_height: 海报高度
+
+    返回:
+        调整尺寸后的海报（PIL.Image对象）
+    """
+    # 每个线程单独打开自己的图片，不共享图片对象
+    with Image.open(poster_path) as poster:
+        # JPEG 按约两倍目标尺寸的比例解码，减少解码的工作量
+        poster.draft("RGB", (cell_width * 2, cell_height * 2))
+        # 海报之后还要旋转一次，双三次插值的画质已经足够
+        return poster.resize((cell_width, cell_height), Image.BICUBIC)
+
 
-def add_shadow(img, offset=(5, 5), shadow_color=(0, 0, 0, 100), blur_radius=3):
+def get_rotation_layout(size, angle):
     """
-    给图片添加右侧和底部阴影
+    按 Image.rotate(expand=True) 的方式计算旋转矩阵和旋转后的尺寸
 
     参数:
-        img: 原始图片（PIL.Image对象）
-        offset: 阴影偏移量，(x, y)格式
-        shadow_color: 阴影颜色，RGBA格式
-        blur_radius: 阴影模糊半径
+        size: 原图尺寸 (width, height)
+        angle: 逆时针旋转角度
 
     返回:
-        添加了阴影的新图片
+        (旋转矩阵, 旋转后的尺寸)，旋转矩阵把旋转后图像上的坐标映射回原图坐标，可直接用于 Image.transform
     """
-    # 创建一个透明背景，比原图大一些，以容纳阴影
-    shadow_width = img.width + offset[0] + blur_radius * 2
-    shadow_height = img.height + offset[1] + blur_radius * 2
+    width, height = size
+    center_x, center_y = width / 2.0, height / 2.0
+    radians = -math.radians(angle % 360.0)
+    a = round(math.cos(radians), 15)
+    b = round(math.sin(radians), 15)
+    d = round(-math.sin(radians), 15)
+    e = round(math.cos(radians), 15)
+
+    # 计算四个角旋转后的位置，得到刚好容纳旋转结果的尺寸
+    xx = []
+    yy = []
+    for x, y in ((0, 0), (width, 0), (width, height), (0, height)):
+        xx.append(a * (x - center_x) + b * (y - center_y) + center_x)
+        yy.append(d * (x - center_x) + e * (y - center_y) + center_y)
+    rotated_width = math.ceil(max(xx)) - math.floor(min(xx))
+    rotated_height = math.ceil(max(yy)) - math.floor(min(yy))
+
+    # 平移使旋转后图像的中心对应原图的中心
+    shift_x = -(rotated_width - width) / 2.0 - center_x
+    shift_y = -(rotated_height - height) / 2.0 - center_y
+    c = a * shift_x + b * shift_y + center_x
+    f = d * shift_x + e * shift_y + center_y
+
+    return (a, b, c, d, e, f), (rotated_width, rotated_height)
+
+
+@lru_cache(maxsize=8)
+def get_rounded_mask(width, height, corner_radius):
+    """创建圆角遮罩，相同尺寸和圆角半径的遮罩只绘制一次（缓存的遮罩不会被修改）"""
+    # 创建一个透明的遮罩
+    mask = Image.new("L", (width, height), 0)
 
-    shadow = Image.new("RGBA", (shadow_width, shadow_height), (0, 0, 0, 0))
+    # 绘制圆角
+    draw = ImageDraw.Draw(mask)
+    draw.rounded_rectangle(
+        [(0, 0), (width, height)],
+        radius=corner_radius,
+        fill=255,
+    )
+    return mask
 
-    # 创建阴影层
-    shadow_layer = Image.new("RGBA", img.size, shadow_color)
 
-    # 将阴影层粘贴到偏移位置
-    shadow.paste(shadow_layer, (blur_radius + offset[0], blur_radius + offset[1]))
+@lru_cache(maxsize=64)
+def load_font(font_path, font_size):
+    """加载字体，相同路径和大小的字体只从磁盘解析一次"""
+    return ImageFont.truetype(font_path, font_size)
 
-    # 模糊阴影
-    shadow = shadow.filter(ImageFilter.GaussianBlur(blur_radius))
 
-    # 创建结果图像
-    result = Image.new("RGBA", shadow.size, (0, 0, 0, 0))
+def get_font(font_path, default_font_path, font_size):
+    """
+    获取字体对象，自定义字体不存在时使用默认字体
 
-    # 将原图粘贴到结果图像上
-    result.paste(img, (blur_radius, blur_radius), img if img.mode == "RGBA" else None)
+    参数:
+        font_path: 自定义字体文件路径（相对于程序目录）
+        default_font_path: 默认字体文件名（位于font目录）
+        font_size: 字体大小
 
-    # 合并阴影和原图（保持原图在上层）
-    shadow_img = Image.alpha_composite(shadow, result)
+    返回:
+        ImageFont.FreeTypeFont对象
+    """
+    font_path = os.path.join(config.CURRENT_DIR, font_path)
+    if not os.path.exists(font_path):
+        logger.warning(f"自定义字体不存在:{font_path}，使用默认字体")
+        font_path = os.path.join(config.CURRENT_DIR, "font", default_font_path)
+    return load_font(font_path, font_size)
 
-    return shadow_img
 
+@lru_cache(maxsize=256)
+def render_text_mask(font, lines, start):
+    """
+    把一行或多行文字栅格化到同一张遮罩上并缓存，同一进程再次绘制相同文字时不再重复栅格化
 
-def draw_text_on_image(
-    image, text, position, font_path,default_font_path, font_size, fill_color=(255, 255, 255, 255)
-):
+    参数:
+        font: 字体对象
+        lines: 每一行的文字及其相对第一行的垂直偏移组成的元组
+        start: 绘制位置的小数部分 (x, y)，与 ImageDraw.text 一样用于亚像素定位
+
+    返回:
+        (文字遮罩, 遮罩左上角相对绘制位置整数部分的偏移)
+    """
+    # 文字中带换行时 ImageDraw.text 会按 multiline_text 排版，这里按相同的行距拆成多行
+    newline_height = font.getbbox("A")[3] + TEXT_NEWLINE_SPACING
+    lines = [
+        (part, offset_y + i * newline_height)
+        for text, offset_y in lines
+        for i, part in enumerate(text.split("\n"))
+    ]
+    boxes = [font.getbbox(text) for text, _ in lines]
+    left = min(box[0] for box in boxes)
+    top = min(box[1] + offset_y for box, (_, offset_y) in zip(boxes, lines))
+    right = max(box[2] for box in boxes)
+    bottom = max(box[3] + offset_y for box, (_, offset_y) in zip(boxes, lines))
+    # 在遮罩上留出足够的边距，保证每一行的绘制坐标都为正数，亚像素定位与逐行绘制完全一致
+    # 行间距为负时后面的行会向上偏移，所以还要考虑最小的垂直偏移
+    pad_x = max(0, -left) + 1
+    pad_y = max(0, -top, -min(offset_y for _, offset_y in lines)) + 1
+    mask = Image.new("L", (pad_x + right + 2, pad_y + bottom + 2), 0)
+    draw = ImageDraw.Draw(mask)
+    for text, offset_y in lines:
+        draw.text(
+            (pad_x + start[0], pad_y + start[1] + offset_y), text, font=font, fill=255
+        )
+
+    # 裁剪掉空白区域
+    bbox = mask.getbbox()
+    if bbox is None:
+        return None, (0, 0)
+    return mask.crop(bbox), (bbox[0] - pad_x, bbox[1] - pad_y)
+
+
+def paste_text(image, position, lines, font, fill_color):
+    """使用缓存的文字遮罩在图像上一次性绘制所有行的文字"""
+    x_frac, x_int = math.modf(position[0])
+    y_frac, y_int = math.modf(position[1])
+    mask, (offset_x, offset_y) = render_text_mask(font, lines, (x_frac, y_frac))
+    if mask is not None:
+        image.paste(
+            fill_color, (int(x_int) + offset_x, int(y_int) + offset_y), mask
+        )
+
+
+def draw_text_on_image(image, text, position, font, fill_color=(255, 255, 255, 255)):
     """
     在图像上绘制文字
 
@@ -60,34 +212,40 @@ def draw_text_on_image(
         image: PIL.Image对象
         text: 要绘制的文字
         position: 文字位置 (x, y)
-        font_path: 字体文件路径
-        font_size: 字体大小
+        font: 字体对象，通过get_font获取
         fill_color: 文字颜色，RGBA格式
 
     返回:
-        添加了文字的图像
+        添加了文字的图像（原地修改传入的image）
     """
-    # 创建一个可绘制的图像副本
-    img_copy = image.copy()
-    draw = ImageDraw.Draw(img_copy)
-    font_path = os.path.join(config.CURRENT_DIR, font_path)
-    if not os.path.exists(font_path):
-        logger.warning(f"自定义字体不存在:{font_path}，使用默认字体")
-        font_path = os.path.join(config.CURRENT_DIR, "font", default_font_path)
-    font = ImageFont.truetype(font_path, font_size)
-    # 绘制文字
-    draw.text(position, text, font=font, fill=fill_color)
+    # 直接在原图上绘制，调用方会使用返回的同一个图像对象
+    paste_text(image, position, ((text, 0),), font, fill_color)
+
+    return image
 
-    return img_copy
+
+@lru_cache(maxsize=256)
+def layout_multiline_text(text, line_height):
+    """
+    计算多行文字的排版，相同的文字和行高只计算一次
+
+    参数:
+        text: 要绘制的文字，按空格换行
+        line_height: 行高（字体大小加行间距）
+
+    返回:
+        每一行的文字及其相对第一行的垂直偏移组成的元组
+    """
+    # 按空格分割文本
+    lines = text.split(" ")
+    return tuple((line, i * line_height) for i, line in enumerate(lines))
 
 
 def draw_multiline_text_on_image(
     image,
     text,
     position,
-    font_path,
-    default_font_path,
-    font_size,
+    font,
     line_spacing=10,
     fill_color=(255, 255, 255, 255),
 ):
@@ -98,53 +256,34 @@ def draw_multiline_text_on_image(
         image: PIL.Image对象
         text: 要绘制的文字
         position: 第一行文字位置 (x, y)
-        font_path: 字体文件路径
-        font_size: 字体大小
+        font: 字体对象，通过get_font获取
         line_spacing: 行间距
         fill_color: 文字颜色，RGBA格式
 
     返回:
-        添加了文字的图像和行数
+        添加了文字的图像（原地修改传入的image）和行数
     """
-    # 创建一个可绘制的图像副本
-    img_copy = image.copy()
-    draw = ImageDraw.Draw(img_copy)
-    font_path = os.path.join(config.CURRENT_DIR, font_path)
-    if not os.path.exists(font_path):
-        logger.warning(f"自定义字体不存在:{font_path}，使用默认字体")
-        font_path = os.path.join(config.CURRENT_DIR, "font", default_font_path)
-    font = ImageFont.truetype(font_path, font_size)
-
-    # 按空格分割文本
-    lines = text.split(" ")
-
-    # 如果只有一行，直接绘制并返回
-    if len(lines) <= 1:
-        draw.text(position, text, font=font, fill=fill_color)
-        return img_copy, 1
+    # 直接在原图上绘制，调用方会使用返回的同一个图像对象
+    lines = layout_multiline_text(text, font.size + line_spacing)
 
-    # 绘制多行文本
-    x, y = position
-    for i, line in enumerate(lines):
-        current_y = y + i * (font_size + line_spacing)
-        draw.text((x, current_y), line, font=font, fill=fill_color)
+    # 所有行栅格化到同一张遮罩上，只需粘贴一次
+    paste_text(image, position, lines, font, fill_color)
 
     # 返回图像和行数
-    return img_copy, len(lines)
+    return image, len(lines)
 
 
-def get_random_color(image_path):
+def get_random_color(img):
     """
     获取图片随机位置的颜色
 
     参数:
-        image_path: 图片文件路径
+        img: 已经打开的图片（PIL.Image对象），直接复用生成九宫格时解码好的海报
 
     返回:
         随机点颜色，RGBA格式
     """
     try:
-        img = Image.open(image_path)
         # 获取图片尺寸
         width, height = img.size
 
@@ -186,23 +325,37 @@ def draw_color_block(image, position, size, color):
         color: 色块颜色，RGBA格式
 
     返回:
-        添加了色块的图像
+        添加了色块的图像（原地修改传入的image）
     """
-    # 创建一个可绘制的图像副本
-    img_copy = image.copy()
-    draw = ImageDraw.Draw(img_copy)
-
-    # 绘制矩形色块
-    draw.rectangle(
-        [position, (position[0] + size[0], position[1] + size[1])], fill=color
+    # 直接在原图上填充色块区域，调用方会使用返回的同一个图像对象
+    # 坐标取整方式与 ImageDraw.rectangle 一致（右下角包含在内）
+    box = (
+        int(position[0]),
+        int(position[1]),
+        int(position[0] + size[0]) + 1,
+        int(position[1] + size[1]) + 1,
     )
+    image.paste(color, box)
+
+    return image
 
-    return img_copy
+
+@lru_cache(maxsize=4)
+def get_gradient_index(width):
+    """
+    计算从左到右每一列的渐变值 (0-255)，同一宽度只计算一次
+
+    使用更加非线性的渐变，使左侧深色区域更大
+    """
+    index = (255.0 * (np.arange(width) / width) ** 0.7).astype(np.intp)
+    # 缓存的数组会被多次使用，禁止修改
+    index.flags.writeable = False
+    return index
 
 
 def create_gradient_background(width, height, name,color=None):
     """
-    创建一个从左到右的渐变背景，使用遮罩技术实现渐变效果
+    创建一个从左到右的渐变背景，使用颜色查找表实现渐变效果
     左侧颜色更深，右侧颜色适中，提供更明显的渐变效果
     
     参数:
@@ -298,68 +451,91 @@ def create_gradient_background(width, height, name,color=None):
 
     # 如果是已经提供的颜色，将其加深
     # 降低各通道的亮度，使颜色更深
-    r = int(selected_color[0] * 0.65)  # 降低35%
-    g = int(selected_color[1] * 0.65)  # 降低35%
-    b = int(selected_color[2] * 0.65)  # 降低35%
-    
-    # 确保RGB值不会小于0
-    r = max(0, r)
-    g = max(0, g)
-    b = max(0, b)
-    
-    # 更新颜色
-    selected_color = (r, g, b, selected_color[3] if len(selected_color) > 3 else 255)
+    dark = tuple(int(c * BACKGROUND_DARKEN_FACTOR) for c in selected_color[:3])
+
+    # 基于加深后的颜色自动生成浅色版本作为右侧颜色
+    # 按比例提亮（限制最大值为255），并确保至少有一定的亮度增加，但不会太亮
+    light = tuple(
+        min(
+            BACKGROUND_MAX_LIGHTNESS,
+            max(min(255, int(c * BACKGROUND_LIGHTEN_FACTOR)), c + BACKGROUND_MIN_LIGHTEN),
+        )
+        for c in dark
+    )
 
-    # 确保selected_color包含alpha通道
-    if len(selected_color) == 3:
-        selected_color = (selected_color[0], selected_color[1], selected_color[2], 255)
-    
-    # 基于selected_color自动生成浅色版本作为右侧颜色
-    # 将selected_color的RGB值增加更合适的比例，使右侧颜色适中
-    # 限制最大值为255
-    r = min(255, int(selected_color[0] * 1.9))  # 从2.2降到1.9
-    g = min(255, int(selected_color[1] * 1.9))  # 从2.2降到1.9
-    b = min(255, int(selected_color[2] * 1.9))  # 从2.2降到1.9
-    
-    # 确保至少有一定的亮度增加，但比之前小
-    r = max(r, selected_color[0] + 80)  # 从100降到80
-    g = max(g, selected_color[1] + 80)  # 从100降到80
-    b = max(b, selected_color[2] + 80)  # 从100降到80
-    
-    # 确保右侧颜色不会太亮
-    r = min(r, 230)  # 限制最大亮度
-    g = min(g, 230)  # 限制最大亮度
-    b = min(b, 230)  # 限制最大亮度
-    
-    # 创建右侧浅色
-    color2 = (r, g, b, selected_color[3])
-    
-    # 创建左右两个纯色图像
-    left_image = Image.new("RGBA", (width, height), selected_color)
-    right_image = Image.new("RGBA", (width, height), color2)
-    
-    # 创建渐变遮罩（从黑到白的横向线性渐变）
-    mask = Image.new("L", (width, height), 0)
-    mask_data = []
-    
-    # 生成遮罩数据，使用更加平滑的过渡
-    for y in range(height):
-        for x in range(width):
-            # 计算从左到右的渐变值 (0-255)
-            # 使用更加非线性的渐变，使左侧深色区域更大
-            mask_value = int(255.0 * (x / width) ** 0.7)  # 从0.85改为0.7
-            mask_data.append(mask_value)
-    
-    # 应用遮罩数据到遮罩图像
-    mask.putdata(mask_data)
-    
-    # 使用遮罩合成左右两个图像
-    # 遮罩中黑色部分(0)显示left_image，白色部分(255)显示right_image
-    gradient = Image.composite(right_image, left_image, mask)
+    # 确保两个颜色都包含alpha通道
+    alpha = selected_color[3] if len(selected_color) > 3 else 255
+    selected_color = (*dark, alpha)
+    color2 = (*light, alpha)
+
+    # 预先计算 256 级的渐变颜色查找表，每列只需按渐变值查表
+    c1 = np.array(selected_color, dtype=np.float32)
+    c2 = np.array(color2, dtype=np.float32)
+    lut = (c1 + (c2 - c1) * GRADIENT_STEPS).astype(np.uint8)
+
+    # 每一行都相同，按渐变值查表得到一行颜色后沿高度方向复制
+    # 直接由 resize 生成整幅可写的图像，不需要先填充再复制
+    row = lut[get_gradient_index(width)]
+    gradient = Image.fromarray(row[None, :, :]).resize((width, height), Image.NEAREST)
     
     return gradient
 
 
+def load_color_cache():
+    """从磁盘加载主色调缓存，只在首次调用时读取文件"""
+    global color_cache
+    if color_cache is None:
+        color_cache = {}
+        if os.path.exists(config.COLOR_CACHE_PATH):
+            try:
+                with open(config.COLOR_CACHE_PATH, "r", encoding="utf-8") as f:
+                    color_cache = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"无法读取主色调缓存，将重新生成: {e}")
+    return color_cache
+
+
+def save_color_cache():
+    """将主色调缓存写回磁盘"""
+    # 多个进程会同时生成海报，写回前先合并其他进程已保存的条目，避免相互覆盖
+    if os.path.exists(config.COLOR_CACHE_PATH):
+        try:
+            with open(config.COLOR_CACHE_PATH, "r", encoding="utf-8") as f:
+                merged = json.load(f)
+            merged.update(color_cache)
+            color_cache.clear()
+            color_cache.update(merged)
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    # 超出上限时丢弃最早写入的条目
+    while len(color_cache) > COLOR_CACHE_MAX_ENTRIES:
+        color_cache.pop(next(iter(color_cache)))
+
+    try:
+        cache_dir = os.path.dirname(config.COLOR_CACHE_PATH)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        # 先写临时文件再替换，避免写入中断时留下损坏的缓存
+        temp_path = f"{config.COLOR_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(color_cache, f)
+        os.replace(temp_path, config.COLOR_CACHE_PATH)
+    except OSError as e:
+        logger.warning(f"无法保存主色调缓存: {e}")
+
+
+def get_color_cache_key(image_path):
+    """
+    计算图片的主色调缓存键
+
+    海报每次运行都会重新下载，修改时间总会变化，所以按文件内容计算摘要
+    """
+    with open(image_path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return f"v{COLOR_CACHE_VERSION}:{digest}"
+
+
 def get_poster_primary_color(image_path):
     """
     分析图片并提取主色调
@@ -371,17 +547,24 @@ def get_poster_primary_color(image_path):
         主色调颜色，RGBA格式
     """
     try:
-        from collections import Counter
-        
+        # 相同的海报直接使用缓存的结果，跳过解码和像素统计
+        cache_key = get_color_cache_key(image_path)
+        cached_colors = load_color_cache().get(cache_key)
+        if cached_colors is not None:
+            return [(tuple(color), count) for color, count in cached_colors]
+
         # 打开图片
         img = Image.open(image_path)
         
         # 缩小图片尺寸以加快处理速度
-        img = img.resize((100, 150), Image.LANCZOS)
+        # 只需要颜色统计，JPEG 直接按缩小的比例解码，再用开销更小的双线性缩放
+        # 其他格式（如 PNG、WebP）无法按比例解码，通过 reducing_gap 先做整数倍缩小
+        img.draft("RGB", (100, 150))
+        img = img.resize((100, 150), Image.BILINEAR, reducing_gap=2.0)
         
-        # 确保图片为RGBA模式
-        if img.mode != 'RGBA':
-            img = img.convert('RGBA')
+        # 统一为RGB或RGBA模式，没有透明信息的图片不需要额外转换出一个alpha通道
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if img.has_transparency_data else "RGB")
             
         # 获取图片中心部分的像素数据（避免边框和角落）
         # width, height = img.size
@@ -394,49 +577,55 @@ def get_poster_primary_color(image_path):
         # center_img = img.crop((center_x1, center_y1, center_x2, center_y2))
 
         # 获取所有像素
-        pixels = list(img.getdata())
-        
-        # 过滤掉接近黑色和白色的像素，以及透明度低的像素
-        filtered_pixels = []
-        for pixel in pixels:
-            r, g, b, a = pixel
-            
-            # 跳过透明度低的像素
-            if a < 200:
-                continue
-                
-            # 计算亮度
-            brightness = (r + g + b) / 3
-            
-            # 跳过过暗或过亮的像素
-            if brightness < 30 or brightness > 220:
-                continue
-                
-            # 添加到过滤后的列表
-            filtered_pixels.append((r, g, b, 255))
-            
+        pixels = np.asarray(img)
+        alpha = pixels[..., 3] if img.mode == "RGBA" else None
+
+        # 计算亮度，直接比较三个通道的整数和，避免浮点除法（30*3=90，220*3=660）
+        brightness_sum = pixels[..., :3].sum(axis=2, dtype=np.uint16)
+
+        # 先按透明度过滤（没有透明通道时所有像素都不透明），再过滤掉接近黑色和白色的像素
+        if alpha is not None:
+            mask = alpha >= 200
+            mask &= brightness_sum >= 90
+        else:
+            mask = brightness_sum >= 90
+        mask &= brightness_sum <= 660
+
         # 如果过滤后没有像素，使用全部像素
-        if not filtered_pixels:
-            filtered_pixels = [(p[0], p[1], p[2], 255) for p in pixels if p[3] > 100]
-            
+        if not mask.any():
+            if alpha is not None:
+                mask = alpha > 100
+            else:
+                mask = np.ones(brightness_sum.shape, dtype=bool)
+
         # 如果仍然没有像素，返回默认颜色
-        if not filtered_pixels:
+        if not mask.any():
             return (150, 100, 50, 255)
-            
-        # 使用Counter找到出现最多的颜色
-        color_counter = Counter(filtered_pixels)
-        common_colors = color_counter.most_common(10)
-        
-        # 如果找到了颜色，返回最常见的颜色
-        if common_colors:
-            return common_colors
-        
-        # 如果无法找到主色调，使用平均值
-        r_avg = sum(p[0] for p in filtered_pixels) // len(filtered_pixels)
-        g_avg = sum(p[1] for p in filtered_pixels) // len(filtered_pixels)
-        b_avg = sum(p[2] for p in filtered_pixels) // len(filtered_pixels)
-        
-        return [(r_avg, g_avg, b_avg, 255)]
+
+        # 照片中几乎每个像素的颜色都不相同，先把每个通道量化到5位（32级），
+        # 再打包成一个15位整数统计每个色块出现的次数
+        quantized = pixels[..., :3].astype(np.uint16) >> 3
+        keys = (quantized[..., 0] << 10) | (quantized[..., 1] << 5) | quantized[..., 2]
+        # 色块只有32768个，直接用 bincount 计数，不需要 np.unique 排序
+        counts = np.bincount(keys[mask], minlength=1 << 15)
+
+        # 按出现次数取最常见的10个色块，并使用色块中心作为颜色
+        top = np.argsort(-counts, kind="stable")[:10]
+        top = top[counts[top] > 0]
+        common_colors = []
+        for i in top:
+            key = int(i)
+            color = (
+                (key >> 10) << 3 | 4,
+                ((key >> 5) & 0x1F) << 3 | 4,
+                (key & 0x1F) << 3 | 4,
+                255,
+            )
+            common_colors.append((color, int(counts[i])))
+
+        color_cache[cache_key] = common_colors
+        save_color_cache()
+        return common_colors
      
         
     except Exception as e:
@@ -449,11 +638,11 @@ def gen_poster_workflow(name):
     将多张电影海报排列成三列，每列三张，然后将每列作为整体旋转并放在渐变背景上
     不再依赖外部模板文件，直接生成渐变背景
     """
+    # 日志前缀在整个流程中不变，只格式化一次
+    log_prefix = f"[{config.JELLYFIN_CONFIG['SERVER_NAME']}][{name}]"
 
     try:
-        logger.info(
-            f"[{config.JELLYFIN_CONFIG['SERVER_NAME']}][{name}] [3/4] 正在生成海报..."
-        )
+        logger.info(f"{log_prefix} [3/4] 正在生成海报...")
         logger.info("-" * 40)
         poster_folder = os.path.join(config.POSTER_FOLDER, name)
         first_image_path = os.path.join(poster_folder, "1.jpg")
@@ -467,6 +656,7 @@ def gen_poster_workflow(name):
         start_y = config.POSTER_GEN_CONFIG["START_Y"]
         column_spacing = config.POSTER_GEN_CONFIG["COLUMN_SPACING"]
         save_columns = config.POSTER_GEN_CONFIG["SAVE_COLUMNS"]
+        png_compress_level = config.POSTER_GEN_CONFIG["PNG_COMPRESS_LEVEL"]
 
         # 定义模板尺寸（可以根据需要调整）
         template_width = 1920  # 或者从配置中获取
@@ -508,7 +698,7 @@ def gen_poster_workflow(name):
         # 确保至少有一张图片
         if not poster_files:
             logger.error(
-                f"[{config.JELLYFIN_CONFIG['SERVER_NAME']}][{name}] 错误: 在 {poster_folder} 中没有找到支持的图片文件"
+                f"{log_prefix} 错误: 在 {poster_folder} 中没有找到支持的图片文件"
             )
             return False
 
@@ -525,8 +715,26 @@ def gen_poster_workflow(name):
             poster_files[i : i + rows] for i in range(0, len(poster_files), rows)
         ]
 
-        # 以渐变背景作为起点
-        result = gradient_bg.copy()
+        # 并发解码并缩放所有海报，Pillow 在解码和缩放时会释放 GIL
+        with ThreadPoolExecutor(
+            max_workers=min(len(poster_files), poster_decode_workers)
+        ) as executor:
+            poster_futures = {
+                poster_path: executor.submit(
+                    prepare_poster, poster_path, cell_width, cell_height
+                )
+                for poster_path in poster_files
+            }
+
+        # 所有海报尺寸和圆角都相同，圆角遮罩只需创建一次
+        rounded_mask = None
+        if corner_radius > 0:
+            rounded_mask = get_rounded_mask(cell_width, cell_height, corner_radius)
+
+        # 以渐变背景作为起点（渐变背景之后不再使用，直接在上面绘制）
+        result = gradient_bg
+        # 第一张海报解码后的图像
+        first_poster = None
         # 处理每一组（每一列）图片
         for col_index, column_posters in enumerate(grouped_posters):
             if col_index >= cols:
@@ -538,122 +746,94 @@ def gen_poster_workflow(name):
             # 计算当前列所有图片组合后的高度（包括间距）
             column_height = rows * cell_height + (rows - 1) * margin
 
+            # 阴影参数：较大的偏移量，更深的黑色，保持模糊半径
+            shadow_offset = 20
+            shadow_blur_radius = 20
+
             # 创建一个透明的画布用于当前列的所有图片，增加宽度以容纳右侧阴影
-            shadow_extra_width = 20 + 20 * 2  # 右侧阴影需要的额外宽度
-            shadow_extra_height = 20 + 20 * 2  # 底部阴影需要的额外高度
-
-            # 修改列画布的尺寸，确保有足够空间容纳阴影
-            column_image = Image.new(
-                "RGBA",
-                (cell_width + shadow_extra_width, column_height + shadow_extra_height),
-                (0, 0, 0, 0),
+            shadow_extra_width = shadow_offset + shadow_blur_radius * 2  # 右侧阴影需要的额外宽度
+            shadow_extra_height = shadow_offset + shadow_blur_radius * 2  # 底部阴影需要的额外高度
+            column_size = (
+                cell_width + shadow_extra_width,
+                column_height + shadow_extra_height,
             )
 
-            # 在列画布上放置每张图片
+            # 先记录每张海报阴影矩形的透明度，整列只模糊一次
+            shadow_alpha = np.zeros((column_size[1], column_size[0]), dtype=np.uint8)
+            # 本列成功解码的海报及其在列画布上的位置
+            column_items = []
+
+            # 计算每张图片在列画布上的位置
             for row_index, poster_path in enumerate(column_posters):
                 try:
-                    # 打开海报
-                    poster = Image.open(poster_path)
-
-                    # 调整海报大小为固定尺寸
-                    resized_poster = poster.resize(
-                        (cell_width, cell_height), Image.LANCZOS
-                    )
-
-                    # 创建圆角遮罩（如果需要）
-                    if corner_radius > 0:
-                        # 创建一个透明的遮罩
-                        mask = Image.new("L", (cell_width, cell_height), 0)
-
-                        # 绘制圆角
-                        from PIL import ImageDraw
-
-                        draw = ImageDraw.Draw(mask)
-                        draw.rounded_rectangle(
-                            [(0, 0), (cell_width, cell_height)],
-                            radius=corner_radius,
-                            fill=255,
-                        )
-
-                        # 应用遮罩
-                        poster_with_corners = Image.new(
-                            "RGBA", resized_poster.size, (0, 0, 0, 0)
-                        )
-                        poster_with_corners.paste(resized_poster, (0, 0), mask)
-                        resized_poster = poster_with_corners
-
-                    # 添加阴影效果到每张海报
-                    resized_poster_with_shadow = add_shadow(
-                        resized_poster,
-                        offset=(20, 20),  # 较大的偏移量
-                        shadow_color=(
-                            0,
-                            0,
-                            0,
-                            255,
-                        ),  # 更深的黑色，但不要超过255的透明度
-                        blur_radius=20,  # 保持模糊半径
-                    )
-
-                    # 计算在列画布上的位置（垂直排列）
-                    y_position = row_index * (cell_height + margin)
-                    x_position = 0  # 一般为0，但在有阴影时可能需要调整
-
-                    # 粘贴到列画布上时，不要减去偏移量，确保阴影有空间
-                    column_image.paste(
-                        resized_poster_with_shadow,
-                        (0, y_position),  # 不减去偏移量，确保阴影有空间
-                        resized_poster_with_shadow,
-                    )
-
+                    # 取出已经解码并缩放好的海报，解码时的异常会在这里抛出
+                    resized_poster = poster_futures[poster_path].result()
                 except Exception as e:
                     logger.error(
-                        f"[{config.JELLYFIN_CONFIG['SERVER_NAME']}][{name}] 处理图片 {os.path.basename(poster_path)} 时出错: {e}"
+                        f"{log_prefix} 处理图片 {os.path.basename(poster_path)} 时出错: {e}"
                     )
                     continue
 
+                # 保留第一张海报，用于获取色块颜色，避免再次打开和解码
+                if poster_path == poster_files[0]:
+                    first_poster = resized_poster
+
+                # 计算在列画布上的位置（垂直排列），左上方留出模糊半径，右下方留出阴影空间
+                y_position = row_index * (cell_height + margin)
+                poster_x = shadow_blur_radius
+                poster_y = y_position + shadow_blur_radius
+                column_items.append((resized_poster, (poster_x, poster_y)))
+
+                # 记录阴影矩形，阴影相对海报向右下方偏移
+                shadow_x = poster_x + shadow_offset
+                shadow_y = poster_y + shadow_offset
+                shadow_alpha[
+                    shadow_y : shadow_y + cell_height,
+                    shadow_x : shadow_x + cell_width,
+                ] = 255
+
+            # 整列阴影只模糊一次
+            shadow_mask = Image.fromarray(shadow_alpha).filter(
+                ImageFilter.GaussianBlur(shadow_blur_radius)
+            )
+            # 使用查找表调整阴影浓度
+            shadow_mask = shadow_mask.point(SHADOW_ALPHA_LUT)
+
+            # 以阴影作为列画布，海报直接带圆角粘贴在阴影上层
+            column_image = Image.new("RGBA", column_size, (0, 0, 0, 0))
+            column_image.putalpha(shadow_mask)
+            for resized_poster, poster_position in column_items:
+                # 使用圆角遮罩（如果需要）
+                if rounded_mask is not None:
+                    mask = rounded_mask
+                elif resized_poster.mode == "RGBA":
+                    mask = resized_poster
+                else:
+                    mask = None
+                column_image.paste(resized_poster, poster_position, mask)
+
             # 保存原始列图像（旋转前）
             if save_columns:
                 column_orig_path = os.path.join(
                     columns_dir, f"{name}_column_{col_index+1}_original.png"
                 )
-                column_image.save(column_orig_path)
-                logger.debug(
-                    f"[{config.JELLYFIN_CONFIG['SERVER_NAME']}][{name}] 已保存原始列图像到: {column_orig_path}"
-                )
+                column_image.save(column_orig_path, compress_level=png_compress_level)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"{log_prefix} 已保存原始列图像到: {column_orig_path}")
 
             # 现在我们有了完整的一列图片，准备旋转它
-            # 创建一个足够大的画布来容纳旋转后的列
-            rotation_canvas_size = int(
-                math.sqrt(
-                    (cell_width + shadow_extra_width) ** 2
-                    + (column_height + shadow_extra_height) ** 2
-                )
-                * 1.5
-            )
-            rotation_canvas = Image.new(
-                "RGBA", (rotation_canvas_size, rotation_canvas_size), (0, 0, 0, 0)
-            )
-
-            # 将列图片放在旋转画布的中央
-            paste_x = (rotation_canvas_size - cell_width) // 2
-            paste_y = (rotation_canvas_size - column_height) // 2
-            rotation_canvas.paste(column_image, (paste_x, paste_y), column_image)
-
-            # 旋转整个列
-            rotated_column = rotation_canvas.rotate(
-                rotation_angle, Image.BICUBIC, expand=True
+            # 先按 Image.rotate(expand=True) 的方式计算旋转矩阵和旋转后的精确尺寸，暂不生成旋转后的图像
+            rotation_matrix, (rotated_width, rotated_height) = get_rotation_layout(
+                column_image.size, rotation_angle
             )
 
-            # 保存旋转后的列图像
-            if save_columns:
-                column_rotated_path = os.path.join(
-                    columns_dir, f"column_{col_index+1}_rotated.png"
-                )
-                rotated_column.save(column_rotated_path)
-                logger.debug(
-                    f"[{config.JELLYFIN_CONFIG['SERVER_NAME']}][{name}] 已保存旋转后的列图像到: {column_rotated_path}"
-                )
+            # 旋转以列画布中心为圆心，而海报区域的中心相对画布中心偏左上（右下方留有阴影空间）
+            # 计算这个偏移旋转后的位置，用于把海报区域的中心放到原来的位置
+            angle = math.radians(rotation_angle)
+            offset_x = (cell_width - column_image.width) / 2
+            offset_y = (column_height - column_image.height) / 2
+            rotated_offset_x = offset_x * math.cos(angle) + offset_y * math.sin(angle)
+            rotated_offset_y = -offset_x * math.sin(angle) + offset_y * math.cos(angle)
 
             # 计算列在模板上的位置（不同的列有不同的y起点）
             column_center_y = start_y + column_height // 2
@@ -667,18 +847,62 @@ def gen_poster_workflow(name):
                 column_center_x += (cell_width) * 2 - 40
 
             # 计算最终放置位置
-            final_x = column_center_x - rotated_column.width // 2 + cell_width // 2
-            final_y = column_center_y - rotated_column.height // 2
+            final_x = round(
+                column_center_x
+                + cell_width // 2
+                - rotated_width / 2
+                - rotated_offset_x
+            )
+            final_y = round(
+                column_center_y - rotated_height / 2 - rotated_offset_y
+            )
+
+            # 旋转后的列有很大一部分超出结果图像，只计算落在结果图像范围内的部分
+            left = max(final_x, 0)
+            top = max(final_y, 0)
+            right = min(final_x + rotated_width, result.width)
+            bottom = min(final_y + rotated_height, result.height)
+            if right <= left or bottom <= top:
+                continue
+
+            # 把旋转矩阵平移到可见区域的左上角，直接生成可见部分
+            a, b, c, d, e, f = rotation_matrix
+            window_x = left - final_x
+            window_y = top - final_y
+            window_matrix = (
+                a,
+                b,
+                a * window_x + b * window_y + c,
+                d,
+                e,
+                d * window_x + e * window_y + f,
+            )
+            rotated_column = column_image.transform(
+                (right - left, bottom - top),
+                Image.AFFINE,
+                window_matrix,
+                Image.BICUBIC,
+            )
+
+            # 保存旋转后的列图像（只包含结果图像范围内的部分）
+            if save_columns:
+                column_rotated_path = os.path.join(
+                    columns_dir, f"column_{col_index+1}_rotated.png"
+                )
+                rotated_column.save(column_rotated_path, compress_level=png_compress_level)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        f"{log_prefix} 已保存旋转后的列图像到: {column_rotated_path}"
+                    )
 
             # 粘贴旋转后的列到结果图像
-            result.paste(rotated_column, (final_x, final_y), rotated_column)
+            result.paste(rotated_column, (left, top), rotated_column)
 
         # 获取第一张图片的随机点颜色
-        if poster_files:
-            first_image_path = poster_files[0]
-            random_color = get_random_color(first_image_path)
+        if first_poster is not None:
+            random_color = get_random_color(first_poster)
         else:
-            # 如果没有图片，生成一个随机颜色
+            # 如果没有图片或第一张海报处理失败，生成一个随机颜色
             random_color = (
                 random.randint(50, 200),
                 random.randint(50, 200),
@@ -710,75 +934,68 @@ def gen_poster_workflow(name):
         )
         # 添加中文名文字
         fangzheng_font_path = os.path.join("myfont", style_config.get("style_ch_font"))
+        fangzheng_font = get_font(fangzheng_font_path, "ch.ttf", 163)
         result = draw_text_on_image(
-            result, library_ch_name, (73.32, 427.34), fangzheng_font_path, "ch.ttf", 163
+            result, library_ch_name, (73.32, 427.34), fangzheng_font
         )
 
         # 如果有英文名，才添加英文名文字
         if library_eng_name:
             # 动态调整字体大小，但统一使用一个字体大小
-            base_font_size = 50  # 默认字体大小
             line_spacing = 5  # 行间距
 
             # 计算行数和调整字体大小
             word_count = len(library_eng_name.split())
             max_chars_per_line = max([len(word) for word in library_eng_name.split()])
 
-            # 根据单词数量或最长单词长度调整字体大小
-            if max_chars_per_line > 10 or word_count > 3:
-                # 字体大小与文本长度成反比
-                font_size = (
-                    base_font_size
-                    * (10 / max(max_chars_per_line, word_count * 3)) ** 0.8
-                )
-                # 设置最小字体大小限制，确保文字不会太小
-                font_size = max(font_size, 30)
-            else:
-                font_size = base_font_size
+            # 根据单词数量或最长单词长度查表得到字体大小
+            # 最长单词超过10个字符或单词超过3个时，字体随文本长度缩小
+            text_length = max(max_chars_per_line, word_count * 3)
+            font_size = ENG_FONT_SIZE_LUT[min(text_length, len(ENG_FONT_SIZE_LUT) - 1)]
 
-            # 打印调试信息
-            logger.debug(
-                f"[{config.JELLYFIN_CONFIG['SERVER_NAME']}][{name}] 英文名 '{library_eng_name}' 单词数量: {word_count}, 最长单词长度: {max_chars_per_line}"
-            )
-            logger.debug(
-                f"[{config.JELLYFIN_CONFIG['SERVER_NAME']}][{name}] 使用字体大小: {font_size:.2f}"
-            )
+            # 打印调试信息，默认日志级别下不格式化
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    f"{log_prefix} 英文名 '{library_eng_name}' 单词数量: {word_count}, 最长单词长度: {max_chars_per_line}"
+                )
+                logger.debug(f"{log_prefix} 使用字体大小: {font_size}")
 
 
             # 使用多行文本绘制
             melete_font_path = os.path.join("myfont", style_config.get("style_eng_font"))
+            melete_font = get_font(melete_font_path, "en.otf", font_size)
             result, line_count = draw_multiline_text_on_image(
                 result,
                 library_eng_name,
                 (124.68, 624.55),
-                melete_font_path, "en.otf",
-                int(font_size),
+                melete_font,
                 line_spacing,
             )
 
             # 根据行数调整色块高度
             color_block_position = (84.38, 620.06)
             # 基础高度为55，每增加一行增加(font_size + line_spacing)的高度
-            color_block_height = 55 + (line_count - 1) * (int(font_size) + line_spacing)
+            color_block_height = 55 + (line_count - 1) * (font_size + line_spacing)
             color_block_size = (21.51, color_block_height)
 
-            logger.debug(
-                f"[{config.JELLYFIN_CONFIG['SERVER_NAME']}][{name}] 色块高度调整为: {color_block_height} (行数: {line_count})"
-            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    f"{log_prefix} 色块高度调整为: {color_block_height} (行数: {line_count})"
+                )
 
+            # 色块在英文名左侧，与文字区域不重叠，两者各自只需一次 paste 填充
+            # 不必合并成一次 NumPy 混合，转换成数组再转回的开销远大于这两次填充
             result = draw_color_block(
                 result, color_block_position, color_block_size, random_color
             )
         # 保存结果
-        result.save(output_path)
-        logger.info(
-            f"[{config.JELLYFIN_CONFIG['SERVER_NAME']}][{name}] 成功: 图片已保存到 {output_path}"
-        )
+        result.save(output_path, compress_level=png_compress_level)
+        logger.info(f"{log_prefix} 成功: 图片已保存到 {output_path}")
         return True
 
     except Exception as e:
         logger.error(
-            f"[{config.JELLYFIN_CONFIG['SERVER_NAME']}][{name}] 创建九宫格图片时出错: {e}",
+            f"{log_prefix} 创建九宫格图片时出错: {e}",
             exc_info=True,
         )
         return False
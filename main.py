@@ -1,6 +1,10 @@
 import os
 import sys
 import time
+import signal
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
 import json
 
@@ -12,6 +16,7 @@ from croniter import croniter
 
 # 导入自定义模块
 import config
+import gen_poster
 from gen_poster import gen_poster_workflow
 from get_library import get_libraries
 from get_poster import download_posters_workflow
@@ -19,6 +24,53 @@ from update_poster import upload_poster_workflow
 from logger import app_logger as logger
 
 
+def get_cpu_count():
+    """
+    获取当前进程可用的CPU数，考虑CPU亲和性和 Docker 等容器的CPU配额
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpu_count = len(os.sched_getaffinity(0))
+    else:
+        cpu_count = os.cpu_count() or 1
+
+    # 依次尝试 cgroup v2 和 cgroup v1 的CPU配额
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r") as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as f:
+                quota = f.read().strip()
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as f:
+                period = f.read().strip()
+        except OSError:
+            return cpu_count
+
+    try:
+        if quota not in ("max", "-1"):
+            cpu_count = min(cpu_count, max(1, int(quota) // int(period)))
+    except ValueError:
+        pass
+    return cpu_count
+
+
+def init_poster_worker(decode_workers):
+    """
+    初始化生成海报的子进程，按每个进程分到的CPU数设置解码海报的线程数
+    """
+    # Ctrl+C 由主进程处理
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    gen_poster.poster_decode_workers = decode_workers
+
+
+def generate_library_poster(jellyfin_config, library_name):
+    """
+    在子进程中生成一个媒体库的海报，每个任务都带上当前服务器的配置
+    """
+    config.JELLYFIN_CONFIG.update(jellyfin_config)
+    return gen_poster_workflow(library_name)
+
+
 def process_libraries():
     for jellyfin_config in config.JELLYFIN_CONFIGS:
         config.JELLYFIN_CONFIG.update(jellyfin_config)
@@ -46,21 +98,61 @@ def process_libraries():
             logger.info(f"  {i}. {library['Name']} (ID: {library['Id']})")
 
         # 这里可以根据需要选择特定的媒体库
+        # 2. 先下载所有媒体库的海报
+        downloaded_libraries = []
         for library in libraries:
             current_library = library["Name"]
             logger.info(
                 f"[{jellyfin_config['SERVER_NAME']}] 开始处理媒体库: {current_library} (ID: {library['Id']})"
             )
-            # 2. 下载海报
             success, count = download_posters_workflow(library["Id"], current_library)
             if not success:
                 logger.warning(
                     f"[{jellyfin_config['SERVER_NAME']}][{current_library}] 下载海报失败"
                 )
                 continue
+            downloaded_libraries.append(library)
 
-            # 3. 生成九宫格海报
-            gen_poster_workflow(current_library)
+        if not downloaded_libraries:
+            logger.warning(
+                f"[{jellyfin_config['SERVER_NAME']}] 没有可生成海报的媒体库"
+            )
+            continue
+
+        # 3. 生成九宫格海报，各媒体库互不依赖，使用进程池并行生成
+        # 每次执行都新建进程池，子进程意外退出时会抛出 BrokenProcessPool 而不是一直等待
+        cpu_count = get_cpu_count()
+        process_count = min(cpu_count, len(downloaded_libraries))
+        failed_libraries = set()
+        with ProcessPoolExecutor(
+            max_workers=process_count,
+            initializer=init_poster_worker,
+            initargs=(max(1, cpu_count // process_count),),
+        ) as executor:
+            poster_futures = {
+                library["Name"]: executor.submit(
+                    generate_library_poster,
+                    dict(config.JELLYFIN_CONFIG),
+                    library["Name"],
+                )
+                for library in downloaded_libraries
+            }
+            for current_library, future in poster_futures.items():
+                try:
+                    future.result()
+                except BrokenProcessPool as e:
+                    logger.error(
+                        f"[{jellyfin_config['SERVER_NAME']}][{current_library}] 生成海报的子进程异常退出: {e}"
+                    )
+                    failed_libraries.add(current_library)
+
+        for library in downloaded_libraries:
+            current_library = library["Name"]
+            if current_library in failed_libraries:
+                logger.warning(
+                    f"[{jellyfin_config['SERVER_NAME']}][{current_library}] 海报未能生成，已跳过上传海报"
+                )
+                continue
 
             # 4. 上传海报到Jellyfin
             if config.JELLYFIN_CONFIG["UPDATE_POSTER"]:  # 检查是否需要更新海报
@@ -162,6 +254,7 @@ def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     try:
         main()
     except KeyboardInterrupt: